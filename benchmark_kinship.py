@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark of the kinship computations of family_tree.Pedigree
+on deep synthetic pedigrees. No database is needed.
+
+Usage:
+    python benchmark_kinship.py [generations] [persons_per_generation]
+
+"""
+
+import random
+import sys
+import time
+
+import family_tree
+
+
+def synthetic_pedigree(generations=20, persons_per_generation=100, seed=None):
+    """
+    Returns a Pedigree of randomly mated generations, for testing and benchmarking.
+    The first generation are founders, every later person gets a random mother
+    and father from the previous generation. Small generations give much pedigree collapse.
+    """
+    assert persons_per_generation >= 2, "persons_per_generation must be at least 2"
+    rand = random.Random(seed)
+    parents = {}
+    previous = []
+    for generation in range(generations):
+        current = list(range(len(parents)+1, len(parents)+persons_per_generation+1))
+        for db_id in current:
+            if generation == 0:
+                parents[db_id] = (-1, -1)
+            else:
+                # Even positions of a generation are women, odd are men
+                mother = rand.choice(previous[0::2])
+                father = rand.choice(previous[1::2])
+                parents[db_id] = (mother, father)
+        previous = current
+    return family_tree.Pedigree(parents)
+
+
+def benchmark(generations=25, persons_per_generation=200, pairs=1000, seed=1):
+    """ Prints the time used for building a pedigree and querying it """
+    start = time.perf_counter()
+    pedigree = synthetic_pedigree(generations, persons_per_generation, seed)
+    print("{} generations, {} persons: built in {:.3f} s".format(generations,
+                                                               len(pedigree.parents),
+                                                               time.perf_counter()-start))
+
+    # Queries on the youngest generation, whose pedigrees are the deepest
+    youngest = sorted(pedigree.parents)[-persons_per_generation:]
+    rand = random.Random(seed)
+    pair_list = [(rand.choice(youngest), rand.choice(youngest)) for _ in range(pairs)]
+
+    start = time.perf_counter()
+    kinships = pedigree.kinship_batch(pair_list)
+    print("Kinship of {} pairs: {:.3f} s, mean {:.4f}".format(pairs,
+                                                            time.perf_counter()-start,
+                                                            sum(kinships.values())/len(kinships)))
+
+    start = time.perf_counter()
+    inbreeding = [pedigree.inbreeding(db_id) for db_id in youngest]
+    print("Inbreeding of {} persons: {:.3f} s, mean {:.4f}".format(len(youngest),
+                                                                 time.perf_counter()-start,
+                                                                 sum(inbreeding)/len(inbreeding)))
+
+    start = time.perf_counter()
+    collapsed = [pedigree.collapsed_ancestors(db_id) for db_id in youngest]
+    print("Collapsed ancestors of {} persons: {:.3f} s, mean {:.1f} ancestors".format(len(youngest),
+                                                                                   time.perf_counter()-start,
+                                                                                   sum(len(c) for c in collapsed)/len(collapsed)))
+
+
+if __name__ == "__main__":
+    benchmark(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark of the demographic statistics of family_tree.FamilyTreeClient.
+Fills the collection benchmark_statistics of the family tree database
+with synthetic persons, replacing its contents, and times each report
+uncached and cached.
+
+Usage:
+    python benchmark_statistics.py [persons]
+
+"""
+
+import datetime
+import random
+import sys
+import time
+
+import family_tree
+
+COLLECTION = "benchmark_statistics"
+PLACES = ["Bergen", "Oslo", "Trondheim", "Stavanger", "Tromsø", "Drammen", "Ålesund", ""]
+
+
+def fill_collection(persons, seed=1):
+    """ Replaces the benchmark collection with persons synthetic persons in generations of 10000 """
+    rand = random.Random(seed)
+    collection = family_tree.CLIENT[COLLECTION]
+    collection.drop()
+    now = datetime.datetime.now()
+    previous = []
+    current = []
+    batch = []
+    for db_id in range(1, persons+1):
+        if db_id % 10000 == 1:
+            previous, current = current, []
+        generation = db_id // 10000
+        birth_date = datetime.datetime(1500+generation*25+rand.randrange(25), rand.randrange(1, 13), rand.randrange(1, 29))
+        death_date = birth_date + datetime.timedelta(days=rand.randrange(365*100))
+        if previous:
+            mother, father = rand.choice(previous), rand.choice(previous)
+        else:
+            mother, father = -1, -1
+        current.append(db_id)
+        batch.append({"database_id": db_id, "first_name": "", "middle_name": "", "last_name": "",
+                      "gender": rand.choice(["M", "F"]), "mother": mother, "father": father,
+                      "spouses": [], "children": [], "birth_date": birth_date, "death_date": death_date,
+                      "birth_place": rand.choice(PLACES), "death_place": rand.choice(PLACES),
+                      "occupation": "", "life_story": "", "comment": "", "add_date": now,
+                      "version": 1, "last_change_date": now})
+        if len(batch) == 10000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+
+
+def benchmark(persons=1000000):
+    """ Prints the time used by each of the statistics, uncached and cached """
+    start = time.perf_counter()
+    fill_collection(persons)
+    print("{} persons inserted in {:.1f} s".format(persons, time.perf_counter()-start))
+
+    client = family_tree.FamilyTreeClient(COLLECTION)
+    reports = [("lifespan_distribution", client.lifespan_distribution),
+               ("births_per_decade", client.births_per_decade),
+               ("average_generation_gap", client.average_generation_gap),
+               ("most_common_places", client.most_common_places)]
+    for name, report in reports:
+        start = time.perf_counter()
+        report()
+        uncached = time.perf_counter() - start
+        start = time.perf_counter()
+        report()
+        cached = time.perf_counter() - start
+        print("{}: {:.3f} s, cached {:.4f} s".format(name, uncached, cached))
+
+
+if __name__ == "__main__":
+    benchmark(*[int(arg) for arg in sys.argv[1:2]])
@@ -32,11 +32,55 @@ import datetime
 import pymongo
 import json
 import os
+import hashlib
+import html
+import multiprocessing
+from array import array
 from subprocess import check_call
 
 DB_NAME = "family_tree"
 COLLECTION = "my_family_tree"
 CLIENT = pymongo.MongoClient()[DB_NAME]
+MS_PER_YEAR = 1000*60*60*24*365.25 # milliseconds in an average year
+
+# Indexes used by FamilyTreeClient.query_persons: equality fields first,
+# then the sort order of the query, (birth_date, database_id) or (death_date, database_id),
+# whose date is also the one queried on ranges. The first index ends with death_date,
+# so that lifespan queries (alive_in) can check the death date from the index keys.
+QUERY_INDEXES = [
+    [("birth_date", pymongo.ASCENDING), ("database_id", pymongo.ASCENDING), ("death_date", pymongo.ASCENDING)],
+    [("death_date", pymongo.ASCENDING), ("database_id", pymongo.ASCENDING)],
+    [("birth_place", pymongo.ASCENDING), ("birth_date", pymongo.ASCENDING), ("database_id", pymongo.ASCENDING)],
+    [("death_place", pymongo.ASCENDING), ("death_date", pymongo.ASCENDING), ("database_id", pymongo.ASCENDING)],
+    [("occupation", pymongo.ASCENDING), ("birth_date", pymongo.ASCENDING), ("database_id", pymongo.ASCENDING)],
+    [("gender", pymongo.ASCENDING), ("birth_date", pymongo.ASCENDING), ("database_id", pymongo.ASCENDING)]
+]
+
+
+def summarize_entry(entry):
+    """
+    Return a one-line string with name, birth and death year
+    of a person's database entry
+    """
+    first_name = entry["first_name"]
+    middle_name = entry["middle_name"]
+    if middle_name != "":
+        middle_name = " " + middle_name
+    last_name = entry["last_name"]
+    birth_date = entry["birth_date"]
+    death_date = entry["death_date"]
+    if birth_date is None:
+        if death_date is None:
+            date_str = ""
+        else:
+            date_str = "- {}".format(death_date.year)
+    else:
+        if death_date is None:
+            date_str = "{} - ".format(birth_date.year)
+        else:
+            date_str = "{} - {}".format(birth_date.year, death_date.year)
+
+    return "{}{} {} {}".format(first_name, middle_name, last_name, date_str)
 
 
 class Person():
@@ -230,25 +274,7 @@ class Person():
             print("Person with database id {} not found".format(db_id))
             return ""
         else:
-            first_name = person["first_name"]
-            middle_name = person["middle_name"]
-            if middle_name != "":
-                middle_name = " " + middle_name
-            last_name = person["last_name"]
-            birth_date = person["birth_date"]
-            death_date = person["death_date"]
-            if birth_date is None:
-                if death_date is None:
-                    date_str = ""
-                else:
-                    date_str = "- {}".format(death_date.year)
-            else:
-                if death_date is None:
-                    date_str = "{} - ".format(birth_date.year)
-                else:
-                    date_str = "{} - {}".format(birth_date.year, death_date.year)
-
-        return "{}{} {} {}".format(first_name, middle_name, last_name, date_str)
+            return summarize_entry(person)
 
 
     def __get_db_id(self):
@@ -356,6 +382,316 @@ class Person():
                                        upsert=False)
 
 
+class Pedigree():
+    """
+    The parent links of a family tree, used for computing
+    kinship and inbreeding coefficients and finding pedigree collapse.
+    Coefficients are memoized, so repeated and batch queries
+    share the work done by earlier queries.
+    """
+    def __init__(self, parents):
+        """
+        parents is a dict {database_id: (mother, father)}, with -1 for unknown parents.
+        Parents that are not in the dict are treated as unknown.
+        """
+        self.parents = {}
+        for db_id, (mother, father) in parents.items():
+            if mother not in parents:
+                mother = -1
+            if father not in parents:
+                father = -1
+            self.parents[db_id] = (mother, father)
+        self.order = self.__topological_order()
+        self.kinship_memo = {}
+
+
+    def __topological_order(self):
+        """
+        Returns a dict {database_id: index}, where every person
+        has a larger index than all of its ancestors
+        """
+        order = {}
+        in_progress = set()
+        for start in self.parents:
+            stack = [(start, False)]
+            while stack:
+                db_id, expanded = stack.pop()
+                if expanded:
+                    in_progress.remove(db_id)
+                    order[db_id] = len(order)
+                elif db_id not in order:
+                    if db_id in in_progress:
+                        raise ValueError("Person with database id {} is its own ancestor".format(db_id))
+                    in_progress.add(db_id)
+                    stack.append((db_id, True))
+                    for parent in self.parents[db_id]:
+                        if parent != -1 and parent not in order:
+                            stack.append((parent, False))
+        return order
+
+
+    def kinship(self, db_id_1, db_id_2):
+        """
+        Returns the kinship coefficient of two persons, i.e. the probability that
+        two alleles picked at random from each of them are identical by descent.
+        Examples: 0.5 for a person with itself, 0.25 for parent - child and full siblings,
+        0.0625 for first cousins.
+        """
+        if db_id_1 == -1 or db_id_2 == -1:
+            return 0.0
+        for db_id in [db_id_1, db_id_2]:
+            assert db_id in self.parents, "Database ID {} not in pedigree".format(db_id)
+
+        # Depth-first evaluation of the recursion, with an explicit stack
+        # so that deep pedigrees do not hit the recursion limit
+        memo = self.kinship_memo
+        stack = [self.__kinship_key(db_id_1, db_id_2)]
+        while stack:
+            key = stack[-1]
+            if key in memo:
+                stack.pop()
+                continue
+            dependencies = self.__kinship_dependencies(key)
+            missing = False
+            for dependency in dependencies:
+                if dependency not in memo:
+                    stack.append(dependency)
+                    missing = True
+            if missing:
+                continue
+            stack.pop()
+            if key[0] == key[1]:
+                # (1 + inbreeding coefficient) / 2
+                memo[key] = 0.5 * (1 + sum(memo[dependency] for dependency in dependencies))
+            else:
+                # Mean kinship of the youngest person's parents with the other person
+                memo[key] = 0.5 * sum(memo[dependency] for dependency in dependencies)
+        return memo[self.__kinship_key(db_id_1, db_id_2)]
+
+
+    def __kinship_key(self, db_id_1, db_id_2):
+        """ Memo key of a pair, with the person latest in the topological order first """
+        if self.order[db_id_1] >= self.order[db_id_2]:
+            return (db_id_1, db_id_2)
+        else:
+            return (db_id_2, db_id_1)
+
+
+    def __kinship_dependencies(self, key):
+        """ Returns the keys of the kinship coefficients needed to compute the one of key """
+        db_id_1, db_id_2 = key
+        mother, father = self.parents[db_id_1]
+        if db_id_1 == db_id_2:
+            if mother == -1 or father == -1:
+                return ()
+            return (self.__kinship_key(mother, father),)
+        # db_id_1 is not an ancestor of db_id_2, so recurse through the parents of db_id_1
+        order = self.order
+        dependencies = []
+        for parent in (mother, father):
+            if parent == -1:
+                continue
+            if order[parent] >= order[db_id_2]:
+                dependencies.append((parent, db_id_2))
+            else:
+                dependencies.append((db_id_2, parent))
+        return dependencies
+
+
+    def kinship_batch(self, pairs):
+        """ Returns a dict {(db_id_1, db_id_2): kinship coefficient} for a list of pairs """
+        return {(db_id_1, db_id_2): self.kinship(db_id_1, db_id_2) for db_id_1, db_id_2 in pairs}
+
+
+    def inbreeding(self, db_id):
+        """ Returns the inbreeding coefficient of a person, equal to the kinship of its parents """
+        mother, father = self.parents[db_id]
+        return self.kinship(mother, father)
+
+
+    def collapsed_ancestors(self, db_id):
+        """
+        Returns a dict {database_id: number of lines} of the ancestors
+        of a person that are reached through more than one line of descent
+        """
+        ancestors = set()
+        stack = [db_id]
+        while stack:
+            for parent in self.parents[stack.pop()]:
+                if parent != -1 and parent not in ancestors:
+                    ancestors.add(parent)
+                    stack.append(parent)
+
+        # Count the lines by passing them on from children to parents,
+        # handling every child before its parents
+        lines = {db_id: 1}
+        for person in sorted(ancestors | {db_id}, key=self.order.get, reverse=True):
+            for parent in self.parents[person]:
+                if parent != -1:
+                    lines[parent] = lines.get(parent, 0) + lines[person]
+        return {ancestor: lines[ancestor] for ancestor in ancestors if lines[ancestor] > 1}
+
+
+# Snapshot of the family tree and output directory of a site worker process
+site_snapshot = {}
+site_dir = ""
+
+SVG_BOX_WIDTH = 170
+SVG_BOX_HEIGHT = 40
+SVG_GAP = 20
+
+
+def relatives(entry):
+    """ Returns a list of (relation, database_id) of a person's closest relatives """
+    relative_list = []
+    if entry["mother"] != -1:
+        relative_list.append(("Mother", entry["mother"]))
+    if entry["father"] != -1:
+        relative_list.append(("Father", entry["father"]))
+    for spouse in entry["spouses"]:
+        relative_list.append(("Spouse", spouse))
+    for child in entry["children"]:
+        relative_list.append(("Child", child))
+    return relative_list
+
+
+def page_fingerprint(snapshot, db_id):
+    """
+    Returns a hash of everything shown on the page of a person:
+    its own entry and the names and dates of its closest relatives
+    """
+    entry = snapshot[db_id]
+    summary_fields = ["first_name", "middle_name", "last_name", "gender", "birth_date", "death_date"]
+    page_data = [entry]
+    for relation, relative in relatives(entry):
+        if relative in snapshot:
+            page_data.append([relation, relative] + [snapshot[relative][field] for field in summary_fields])
+    page_json = json.dumps(page_data, default=str, sort_keys=True)
+    return hashlib.sha1(page_json.encode("utf-8")).hexdigest()
+
+
+def person_page_name(db_id):
+    return "person_{}.html".format(db_id)
+
+
+def render_person_page(snapshot, db_id):
+    """ Returns the HTML page of a person, including an SVG of its closest family """
+    entry = snapshot[db_id]
+    title = html.escape(summarize_entry(entry))
+    lines = ["<!DOCTYPE html>",
+             "<html>",
+             "<head><meta charset=\"utf-8\"><title>{}</title></head>".format(title),
+             "<body>",
+             "<p><a href=\"index.html\">All persons</a></p>",
+             "<h1>{}</h1>".format(title),
+             "<table>"]
+    details = [("Gender", entry["gender"]),
+               ("Birth date", format_date(entry["birth_date"])),
+               ("Birth place", entry["birth_place"]),
+               ("Death date", format_date(entry["death_date"])),
+               ("Death place", entry["death_place"]),
+               ("Occupation", entry["occupation"]),
+               ("Life story", entry["life_story"])]
+    for label, value in details:
+        lines.append("<tr><th>{}</th><td>{}</td></tr>".format(label, html.escape(str(value))))
+    lines.append("</table>")
+
+    # Family members, as in Person.print_info with verbose = f
+    lines.append("<h2>Family</h2>")
+    lines.append("<ul>")
+    for relation, relative in relatives(entry):
+        if relative in snapshot:
+            lines.append("<li>{}: <a href=\"{}\">{}</a></li>".format(relation,
+                                                                  person_page_name(relative),
+                                                                  html.escape(summarize_entry(snapshot[relative]))))
+    lines.append("</ul>")
+    lines.append(render_family_svg(snapshot, db_id))
+    lines.append("</body>")
+    lines.append("</html>")
+    return "\n".join(lines) + "\n"
+
+
+def format_date(date):
+    if isinstance(date, datetime.datetime):
+        return date.strftime("%Y-%m-%d")
+    else:
+        return ""
+
+
+def format_year(date):
+    if isinstance(date, datetime.datetime):
+        return date.year
+    else:
+        return ""
+
+
+def render_family_svg(snapshot, db_id):
+    """
+    Returns an SVG drawing of a person's closest family:
+    parents on top, the person and its spouses in the middle, and children at the bottom
+    """
+    entry = snapshot[db_id]
+    rows = [[parent for parent in [entry["mother"], entry["father"]] if parent in snapshot],
+            [db_id] + [spouse for spouse in entry["spouses"] if spouse in snapshot],
+            [child for child in entry["children"] if child in snapshot]]
+    width = max(len(row) for row in rows) * (SVG_BOX_WIDTH+SVG_GAP) + SVG_GAP
+    height = 3 * (SVG_BOX_HEIGHT+2*SVG_GAP) + SVG_GAP
+
+    # Upper left corner of each box, with each row centered
+    positions = {}
+    for row_number, row in enumerate(rows):
+        row_width = len(row) * (SVG_BOX_WIDTH+SVG_GAP) - SVG_GAP
+        x = (width-row_width) // 2
+        y = SVG_GAP + row_number * (SVG_BOX_HEIGHT+2*SVG_GAP)
+        for person in row:
+            positions[(row_number, person)] = (x, y)
+            x += SVG_BOX_WIDTH + SVG_GAP
+
+    lines = ["<svg xmlns=\"http://www.w3.org/2000/svg\" width=\"{}\" height=\"{}\">".format(width, height)]
+
+    # Links from the parents to the person, and from the person to the children
+    person_x, person_y = positions[(1, db_id)]
+    links = []
+    for parent in rows[0]:
+        parent_x, parent_y = positions[(0, parent)]
+        links.append((parent_x, parent_y+SVG_BOX_HEIGHT, person_x, person_y))
+    for child in rows[2]:
+        child_x, child_y = positions[(2, child)]
+        links.append((person_x, person_y+SVG_BOX_HEIGHT, child_x, child_y))
+    for x1, y1, x2, y2 in links:
+        lines.append("<line x1=\"{}\" y1=\"{}\" x2=\"{}\" y2=\"{}\" stroke=\"black\"/>".format(x1+SVG_BOX_WIDTH//2, y1,
+                                                                                          x2+SVG_BOX_WIDTH//2, y2))
+
+    for (row_number, person), (x, y) in positions.items():
+        relative = snapshot[person]
+        name = "{} {}".format(relative["first_name"], relative["last_name"])
+        years = "{} - {}".format(format_year(relative["birth_date"]), format_year(relative["death_date"]))
+        if person == db_id:
+            fill = "#dddddd"
+        else:
+            fill = "white"
+        lines.append("<a href=\"{}\">".format(person_page_name(person)))
+        lines.append("<rect x=\"{}\" y=\"{}\" width=\"{}\" height=\"{}\" fill=\"{}\" stroke=\"black\"/>".format(x, y, SVG_BOX_WIDTH, SVG_BOX_HEIGHT, fill))
+        lines.append("<text x=\"{}\" y=\"{}\" text-anchor=\"middle\" font-size=\"12\">{}</text>".format(x+SVG_BOX_WIDTH//2, y+16, html.escape(name)))
+        lines.append("<text x=\"{}\" y=\"{}\" text-anchor=\"middle\" font-size=\"12\">{}</text>".format(x+SVG_BOX_WIDTH//2, y+32, years))
+        lines.append("</a>")
+    lines.append("</svg>")
+    return "\n".join(lines)
+
+
+def init_site_worker(snapshot, output_dir):
+    """ Stores the snapshot in a worker process, so that it is only sent once """
+    global site_snapshot, site_dir
+    site_snapshot = snapshot
+    site_dir = output_dir
+
+
+def write_person_page(db_id):
+    """ Writes the page of a person, in a worker process """
+    with open(os.path.join(site_dir, person_page_name(db_id)), "w", encoding="utf-8") as fh:
+        fh.write(render_person_page(site_snapshot, db_id))
+
+
 class FamilyTreeClient():
     """
     Interaction with the family tree stored in the database,
@@ -365,6 +701,9 @@ class FamilyTreeClient():
     """
     def __init__(self, collection=COLLECTION):
         self.collection = collection
+        self.stats_cache = {}
+        self.stats_indexes_created = False
+        self.query_indexes_created = False
         try:
             self.db = CLIENT[collection]
             print("Current family tree: {}\nNumber of persons: {}"\
@@ -574,6 +913,136 @@ class FamilyTreeClient():
             return True
 
 
+    def ensure_query_indexes(self):
+        """
+        Create the indexes used by query_persons. The compound indexes start with
+        the field queried on equality, followed by the sort order and date ranges.
+        """
+        for keys in QUERY_INDEXES:
+            self.db.create_index(keys)
+        self.query_indexes_created = True
+
+
+    def query_persons(self, born=None, died=None, alive_in=None, birth_place=None, death_place=None,
+                      occupation=None, gender=None, page=None, page_size=100, explain=False):
+        """
+        Query database on life details and return a generator of matching Person objects,
+        sorted on birth date, or on death date if only died and death_place are given.
+        The results are streamed from the database in batches of page_size.
+        If page is given, only that page (starting at 0) of page_size results is returned.
+        If explain == True, the query plan is printed and returned instead of the results.
+
+        born, died and alive_in are either a year, a (first year, last year) tuple,
+        or datetimes instead of years. Both ends of a range are included,
+        and either may be None for an open range.
+        alive_in matches persons born before the end of the range, that did not die before its start.
+        The places, occupation and gender must match exactly.
+
+        Example: query_persons(born=(1850, 1900), birth_place="Bergen"), query_persons(alive_in=1920)
+        """
+        if not self.query_indexes_created:
+            self.ensure_query_indexes()
+
+        query = {}
+        for field, value in [("birth_place", birth_place),
+                             ("death_place", death_place),
+                             ("occupation", occupation),
+                             ("gender", gender)]:
+            if value is not None:
+                query[field] = value
+        if born is not None:
+            query["birth_date"] = self.__date_range(born)
+        if died is not None:
+            query["death_date"] = self.__date_range(died)
+        if alive_in is not None:
+            alive_range = self.__date_range(alive_in)
+            birth_range = query.setdefault("birth_date", {"$type": "date"})
+            for operator in ["$lt", "$lte"]:
+                # Born before the end of the range
+                if operator in alive_range:
+                    if operator not in birth_range or birth_range[operator] > alive_range[operator]:
+                        birth_range[operator] = alive_range[operator]
+            if "$gte" in alive_range:
+                # Alive (no death date), or died after the start of the range
+                query.setdefault("death_date", {})["$not"] = {"$lt": alive_range["$gte"]}
+
+        # Sort on the date queried on, so that the matching index also gives the order
+        if born is None and alive_in is None and birth_place is None and (died is not None or death_place is not None):
+            sort_field = "death_date"
+        else:
+            sort_field = "birth_date"
+        assert page_size > 0, "page_size must be larger than 0"
+        cursor = self.db.find(query).sort([(sort_field, pymongo.ASCENDING),
+                                           ("database_id", pymongo.ASCENDING)])
+        if page is not None:
+            assert page >= 0, "page must be 0 or larger"
+            cursor = cursor.skip(page*page_size).limit(page_size)
+
+        if explain:
+            plan = cursor.explain()
+            print("Query: {}".format(query))
+            print("Indexes used: {}".format(", ".join(self.__plan_indexes(plan["queryPlanner"]["winningPlan"])) or "none"))
+            return plan
+        return self.__stream_persons(cursor.batch_size(page_size))
+
+
+    def print_query(self, **query):
+        """
+        Print short details of the persons matching a query,
+        or the indexes used if explain == True.
+        For the query parameters, see FamilyTreeClient.query_persons
+        """
+        if query.get("explain"):
+            self.query_persons(**query)
+            return
+        for person in self.query_persons(**query):
+            self.__print_entry({"database_id": person.database_ID,
+                                "first_name": person.first_name,
+                                "middle_name": person.middle_name,
+                                "last_name": person.last_name,
+                                "birth_date": person.birth_date,
+                                "death_date": person.death_date})
+
+
+    def __stream_persons(self, cursor):
+        """ Yields Person objects of the database entries of a cursor """
+        for results in cursor:
+            person = Person()
+            person.from_db_data(**results, collection=self.collection)
+            yield person
+
+
+    def __date_range(self, value):
+        """
+        Returns a query on a date field from a year, a datetime
+        or a (first, last) tuple of these, with None for an open end
+        """
+        if isinstance(value, tuple):
+            first, last = value
+        else:
+            first, last = value, value
+        date_range = {"$type": "date"}
+        if isinstance(first, datetime.datetime):
+            date_range["$gte"] = first
+        elif first is not None:
+            date_range["$gte"] = datetime.datetime(int(first), 1, 1)
+        if isinstance(last, datetime.datetime):
+            date_range["$lte"] = last
+        elif last is not None:
+            date_range["$lt"] = datetime.datetime(int(last)+1, 1, 1)
+        return date_range
+
+
+    def __plan_indexes(self, plan):
+        """ Returns the names of the indexes used in a query plan """
+        indexes = []
+        if "indexName" in plan:
+            indexes.append(plan["indexName"])
+        for stage in plan.get("inputStages", []) + [plan[key] for key in ["inputStage", "queryPlan"] if key in plan]:
+            indexes += self.__plan_indexes(stage)
+        return indexes
+
+
     def search_person(self):
         """
         Query database on name and return results.
@@ -735,4 +1204,258 @@ class FamilyTreeClient():
     def _print_link(self, node_id_1, node_id_2):
         return "p{} -- p{};\n".format(node_id_1, node_id_2)
 
-        
+
+    def build_site(self, output_dir="", processes=None, force=False):
+        """
+        Export the family tree as a static website, with one page per person.
+        The pages are written in parallel by processes worker processes (default: one per CPU).
+        Only pages where the person or its closest relatives have changed since
+        the last build are rewritten, unless force == True.
+        """
+        if output_dir == "":
+            output_dir = "{}_site".format(self.collection)
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        # Load the entire family tree in one query
+        snapshot = {entry["database_id"]: entry for entry in self.db.find({}, {"_id": 0})}
+
+        # Compare with the fingerprints of the pages from the last build
+        manifest_file = os.path.join(output_dir, "manifest.json")
+        old_manifest = {}
+        if os.path.isfile(manifest_file):
+            with open(manifest_file) as fh:
+                old_manifest = json.load(fh)
+        manifest = {str(db_id): page_fingerprint(snapshot, db_id) for db_id in snapshot}
+        changed = [db_id for db_id in snapshot
+                   if force
+                   or old_manifest.get(str(db_id)) != manifest[str(db_id)]
+                   or not os.path.isfile(os.path.join(output_dir, person_page_name(db_id)))]
+
+        # Remove the pages of deleted persons
+        for db_id in old_manifest:
+            if db_id not in manifest and os.path.isfile(os.path.join(output_dir, person_page_name(db_id))):
+                os.remove(os.path.join(output_dir, person_page_name(db_id)))
+
+        if changed:
+            with multiprocessing.Pool(processes, initializer=init_site_worker,
+                                      initargs=(snapshot, output_dir)) as pool:
+                pool.map(write_person_page, changed, chunksize=max(1, len(changed)//(4*(processes or os.cpu_count() or 1))))
+
+        # Index of all persons
+        with open(os.path.join(output_dir, "index.html"), "w", encoding="utf-8") as fh:
+            fh.write("<!DOCTYPE html>\n<html>\n")
+            fh.write("<head><meta charset=\"utf-8\"><title>{}</title></head>\n".format(html.escape(self.collection)))
+            fh.write("<body>\n<h1>{}</h1>\n<ul>\n".format(html.escape(self.collection)))
+            for entry in sorted(snapshot.values(), key=lambda entry: (entry["last_name"], entry["first_name"], entry["database_id"])):
+                fh.write("<li><a href=\"{}\">{}</a></li>\n".format(person_page_name(entry["database_id"]),
+                                                                  html.escape(summarize_entry(entry))))
+            fh.write("</ul>\n</body>\n</html>\n")
+
+        with open(manifest_file, "w") as fh:
+            json.dump(manifest, fh)
+
+        print("Family tree exported to {}, {} of {} pages rebuilt".format(output_dir, len(changed), len(snapshot)))
+
+
+    def lifespan_distribution(self, bin_size=10):
+        """
+        Returns a dict with the number of persons per lifespan interval,
+        e.g. {60: 12, 70: 20} for bin_size 10.
+        Only persons with both birth and death dates registered are counted.
+        """
+        assert bin_size > 0, "bin_size must be positive"
+        if not self.stats_indexes_created:
+            self.ensure_statistics_indexes()
+        pipeline = [
+            {"$match": {"birth_date": {"$type": "date"},
+                        "death_date": {"$type": "date"}}},
+            {"$project": {"lifespan": {"$divide": [{"$subtract": ["$death_date", "$birth_date"]},
+                                                   MS_PER_YEAR]}}},
+            {"$group": {"_id": {"$multiply": [{"$floor": {"$divide": ["$lifespan", bin_size]}},
+                                              bin_size]},
+                        "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}}
+        ]
+        results = self.__cached_aggregate(("lifespan", bin_size), pipeline)
+        return {int(entry["_id"]): entry["count"] for entry in results}
+
+
+    def births_per_decade(self):
+        """ Returns a dict with the number of births per decade, e.g. {1850: 4, 1860: 7} """
+        if not self.stats_indexes_created:
+            self.ensure_statistics_indexes()
+        pipeline = [
+            {"$match": {"birth_date": {"$type": "date"}}},
+            {"$project": {"year": {"$year": "$birth_date"}}},
+            {"$group": {"_id": {"$subtract": ["$year", {"$mod": ["$year", 10]}]},
+                        "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}}
+        ]
+        results = self.__cached_aggregate(("births_per_decade",), pipeline)
+        return {int(entry["_id"]): entry["count"] for entry in results}
+
+
+    def average_generation_gap(self):
+        """
+        Returns the average age (in years) of parents at the birth of their children,
+        or None if no parent-child pair has both birth dates registered
+        """
+        if not self.stats_indexes_created:
+            self.ensure_statistics_indexes()
+        return self.__cached(("generation_gap",), self.__compute_generation_gap)
+
+
+    def __compute_generation_gap(self):
+        """
+        Computes the average generation gap from the birth snapshot,
+        joining each person with its parents in memory
+        """
+        births, child_births, mothers, fathers = self.__cached(("birth_snapshot",), self.__load_birth_snapshot)
+        gaps = []
+        for parents in (mothers, fathers):
+            # Unknown birth dates are NaN, which is the only value not equal to itself
+            gaps += [child_birth - parent_birth
+                     for child_birth, parent_birth in zip(child_births, map(births.__getitem__, parents))
+                     if parent_birth == parent_birth]
+        if len(gaps) == 0:
+            return None
+        return sum(gaps) / len(gaps) / (MS_PER_YEAR/1000)
+
+
+    def __load_birth_snapshot(self):
+        """
+        Returns the birth dates and parents of the family tree, bulk loaded in one query, as
+        - an array of birth dates (seconds since 1970) indexed by database_id, NaN if unknown
+        - an array of the birth dates of the persons with a birth date registered
+        - lists of the mothers and fathers of the same persons
+        """
+        epoch = datetime.datetime(1970, 1, 1)
+        db_ids = []
+        child_births = array("d")
+        mothers = []
+        fathers = []
+        for entry in self.db.find({"birth_date": {"$type": "date"}},
+                                  {"_id": 0, "database_id": 1, "birth_date": 1, "mother": 1, "father": 1}):
+            db_ids.append(entry["database_id"])
+            child_births.append((entry["birth_date"] - epoch).total_seconds())
+            mothers.append(entry["mother"])
+            fathers.append(entry["father"])
+
+        # The last element is a spare NaN, so that unknown parents (-1) also give NaN
+        size = max(db_ids, default=0) + 2
+        births = array("d", [float("nan")]) * size
+        for db_id, birth in zip(db_ids, child_births):
+            births[db_id] = birth
+        mothers = [mother if 0 <= mother < size else -1 for mother in mothers]
+        fathers = [father if 0 <= father < size else -1 for father in fathers]
+        return births, child_births, mothers, fathers
+
+
+    def most_common_places(self, place_field="birth_place", limit=10):
+        """
+        Returns a list of (place, count) tuples of the most common places,
+        most common first. place_field must be birth_place or death_place.
+        """
+        field_list = ["birth_place", "death_place"]
+        assert place_field in field_list, "Illegal place field. place_field must be one of the following: {}".format(field_list)
+        if not self.stats_indexes_created:
+            self.ensure_statistics_indexes()
+        pipeline = [
+            {"$match": {place_field: {"$nin": ["", None]}}},
+            {"$group": {"_id": "${}".format(place_field), "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": limit}
+        ]
+        results = self.__cached_aggregate(("places", place_field, limit), pipeline)
+        return [(entry["_id"], entry["count"]) for entry in results]
+
+
+    def print_statistics(self):
+        """ Prints a summary of the demographic statistics of the family tree """
+        print("Lifespans:")
+        for lifespan, count in self.lifespan_distribution().items():
+            print("\t{} years:\t{}".format(lifespan, count))
+        print("Births per decade:")
+        for decade, count in self.births_per_decade().items():
+            print("\t{}s:\t{}".format(decade, count))
+        gap = self.average_generation_gap()
+        if gap is None:
+            print("Average generation gap:")
+        else:
+            print("Average generation gap: {:.1f} years".format(gap))
+        for place_field in ["birth_place", "death_place"]:
+            print("Most common {}s:".format(place_field.replace("_", " ")))
+            for place, count in self.most_common_places(place_field):
+                print("\t{}:\t{}".format(place, count))
+
+
+    def load_pedigree(self):
+        """
+        Returns a Pedigree of the family tree, for computing kinship and pedigree collapse.
+        The pedigree is bulk loaded in one query, and reused until the family tree is changed.
+        """
+        if not self.stats_indexes_created:
+            self.ensure_statistics_indexes()
+        return self.__cached(("pedigree",), self.__load_pedigree)
+
+
+    def __load_pedigree(self):
+        results = self.db.find({}, {"_id": 0, "database_id": 1, "mother": 1, "father": 1})
+        return Pedigree({entry["database_id"]: (entry["mother"], entry["father"]) for entry in results})
+
+
+    def print_kinship(self, db_id_1, db_id_2):
+        """ Prints the kinship of two persons, their inbreeding coefficients and pedigree collapse """
+        pedigree = self.load_pedigree()
+        print("Kinship coefficient: {:.6f}".format(pedigree.kinship(db_id_1, db_id_2)))
+        for db_id in [db_id_1, db_id_2]:
+            print("Inbreeding coefficient of {}: {:.6f}".format(db_id, pedigree.inbreeding(db_id)))
+            collapsed = pedigree.collapsed_ancestors(db_id)
+            print("Collapsed ancestors of {} (database id: lines): {}".format(db_id,
+                  ", ".join("{}: {}".format(ancestor, collapsed[ancestor]) for ancestor in sorted(collapsed))))
+
+
+    def ensure_statistics_indexes(self):
+        """
+        Create the index used for detecting changes to the family tree,
+        so that cached statistics can be reused until the family tree is changed
+        """
+        self.db.create_index("last_change_date")
+        self.stats_indexes_created = True
+
+
+    def __cached_aggregate(self, key, pipeline):
+        """
+        Runs an aggregation pipeline on the family tree and returns the results as a list.
+        Results are cached until the family tree is changed.
+        """
+        return self.__cached(key, lambda: list(self.db.aggregate(pipeline)))
+
+
+    def __cached(self, key, compute):
+        """
+        Returns the cached result of key, or the result of calling compute
+        if the family tree has changed since it was cached
+        """
+        token = self.__cache_token()
+        cached = self.stats_cache.get(key)
+        if cached is not None and cached[0] == token:
+            return cached[1]
+        result = compute()
+        self.stats_cache[key] = (token, result)
+        return result
+
+
+    def __cache_token(self):
+        """
+        Returns the number of persons and the latest change date of the family tree,
+        which changes whenever a person is added, deleted or changed by any client.
+        Changes that do not update last_change_date are not detected.
+        """
+        latest = self.db.find_one(sort=[("last_change_date", -1)],
+                                  projection={"_id": 0, "last_change_date": 1})
+        if latest is None:
+            return (0, None)
+        return (self.db.estimated_document_count(), latest["last_change_date"])
+